@@ -0,0 +1,250 @@
+"""
+Streaming export and bulk import of cubes.
+
+Exports are generators, so a response or file can be written one cube at a
+time without building the whole document in memory. Three formats are
+supported:
+
+- csv: one row per card, using CubeCobra's column names plus Cube ID and
+  Cube columns. A cube without cards gets a single row with no card. A
+  CubeCobra export, which has no cube columns, is read as a single cube.
+- txt: CubeCobra's plain list, one card name per line. When several cubes
+  are exported, each starts with a "# Cube name" line.
+- json: one JSON object per line per cube (JSON Lines), which keeps the
+  archetypes and description and can be read back one cube at a time
+
+Imports read the same formats and create cubes in batches, inserting the
+cards and archetypes rows straight into the M2M through tables.
+"""
+import csv
+import json
+import logging
+
+from django.db import transaction
+from django.db.models import Prefetch
+
+from cube_generator.models import Archetype, Card, Cube
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'txt': 'text/plain',
+    'json': 'application/x-ndjson',
+}
+
+CSV_COLUMNS = ['Cube ID', 'Cube', 'name', 'CMC', 'Type', 'Color', 'Set', 'Rarity', 'image URL', 'Scryfall ID']
+
+DEFAULT_CUBE_NAME = 'Imported cube'
+
+# Number of cubes fetched (with their cards and archetypes) per query
+CHUNK_SIZE = 100
+
+
+class Echo:
+    """File-like object whose write() returns the value, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def cubes_for_export(queryset):
+    """
+    Iterate over cubes with their cards and archetypes prefetched a chunk at a
+    time, so each chunk costs three queries regardless of how many cubes there are.
+    """
+    cards = Card.objects.only(
+        'scryfall_id', 'name', 'mana_value', 'type_line', 'color_identity',
+        'set_name', 'rarity', 'img_url',
+    ).order_by('name')
+    return queryset.order_by('pk').prefetch_related(
+        Prefetch('cards', queryset=cards),
+        'archetypes',
+    ).iterator(chunk_size=CHUNK_SIZE)
+
+
+def export_csv(cubes):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for cube in cubes:
+        cards = cube.cards.all()
+        if not cards:
+            yield writer.writerow([cube.pk, cube.name])
+        for card in cards:
+            yield writer.writerow([
+                cube.pk, cube.name, card.name, card.mana_value, card.type_line,
+                card.color_identity, card.set_name, card.rarity, card.img_url,
+                card.scryfall_id,
+            ])
+
+
+def export_txt(cubes, headers=True):
+    """
+    Write card names one per line. Leave headers off for a single cube, since
+    CubeCobra would read the "# Cube name" line as a card name.
+    """
+    for cube in cubes:
+        if headers:
+            yield f'# {cube.name}\n'
+        for card in cube.cards.all():
+            yield f'{card.name}\n'
+        if headers:
+            yield '\n'
+
+
+def export_json(cubes):
+    for cube in cubes:
+        yield json.dumps({
+            'name': cube.name,
+            'description': cube.description,
+            'archetypes': [archetype.name for archetype in cube.archetypes.all()],
+            'cards': [
+                {'scryfall_id': card.scryfall_id, 'name': card.name}
+                for card in cube.cards.all()
+            ],
+        }) + '\n'
+
+
+EXPORTERS = {
+    'csv': export_csv,
+    'txt': export_txt,
+    'json': export_json,
+}
+
+
+def export_cubes(queryset, fmt, single_cube=False):
+    """Yield the cubes in the queryset as chunks of text in the given format."""
+    cubes = cubes_for_export(queryset)
+    if fmt == 'txt':
+        return export_txt(cubes, headers=not single_cube)
+    return EXPORTERS[fmt](cubes)
+
+
+def read_csv(lines, default_name=DEFAULT_CUBE_NAME):
+    cube = None
+    cube_id = None
+    for row in csv.DictReader(lines):
+        # Rows are grouped by Cube ID, since several cubes can share a name
+        if cube is None or row.get('Cube ID') != cube_id:
+            if cube is not None:
+                yield cube
+            cube_id = row.get('Cube ID')
+            cube = {'name': row.get('Cube') or default_name, 'description': '', 'archetypes': [], 'cards': []}
+        if row['name']:
+            cube['cards'].append({'scryfall_id': row.get('Scryfall ID') or None, 'name': row['name']})
+    if cube is not None:
+        yield cube
+
+
+def read_txt(lines, default_name=DEFAULT_CUBE_NAME):
+    cube = None
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('#'):
+            if cube is not None:
+                yield cube
+            cube = {'name': line.lstrip('#').strip(), 'description': '', 'archetypes': [], 'cards': []}
+            continue
+        if cube is None:
+            # A bare CubeCobra list without a header line
+            cube = {'name': default_name, 'description': '', 'archetypes': [], 'cards': []}
+        cube['cards'].append({'scryfall_id': None, 'name': line})
+    if cube is not None:
+        yield cube
+
+
+def read_json(lines, default_name=DEFAULT_CUBE_NAME):
+    for line in lines:
+        if line.strip():
+            cube = json.loads(line)
+            cube.setdefault('name', default_name)
+            cube.setdefault('description', '')
+            cube.setdefault('archetypes', [])
+            yield cube
+
+
+READERS = {
+    'csv': read_csv,
+    'txt': read_txt,
+    'json': read_json,
+}
+
+
+def read_cubes(lines, fmt, default_name=DEFAULT_CUBE_NAME):
+    """
+    Parse an iterable of text lines into cube dicts, one cube at a time.
+    default_name names cubes that the file gives no name to.
+    """
+    return READERS[fmt](lines, default_name=default_name)
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def resolve_cards(batch):
+    """
+    Map the scryfall IDs and names referenced in a batch of cubes to Card pks.
+    Names are looked up for every card, as the fallback for IDs from another
+    database. Card has a row per printing, so a name maps to its oldest row.
+    """
+    scryfall_ids = {card['scryfall_id'] for cube in batch for card in cube['cards'] if card.get('scryfall_id')}
+    names = {card['name'] for cube in batch for card in cube['cards']}
+    by_scryfall_id = dict(
+        Card.objects.filter(scryfall_id__in=scryfall_ids).order_by('scryfall_id', '-pk').values_list('scryfall_id', 'pk')
+    )
+    # dict() keeps the last pk per name, which this ordering makes the lowest
+    by_name = dict(Card.objects.filter(name__in=names).order_by('name', '-pk').values_list('name', 'pk'))
+    return by_scryfall_id, by_name
+
+
+def import_batch(batch, user, archetypes):
+    by_scryfall_id, by_name = resolve_cards(batch)
+    cubes = Cube.objects.bulk_create([
+        Cube(name=data['name'], description=data['description'], user=user)
+        for data in batch
+    ])
+
+    CubeCard = Cube.cards.through
+    CubeArchetype = Cube.archetypes.through
+    cube_cards = []
+    cube_archetypes = []
+    for cube, data in zip(cubes, batch):
+        card_ids = set()
+        for card in data['cards']:
+            card_id = by_scryfall_id.get(card.get('scryfall_id')) or by_name.get(card['name'])
+            if card_id is None:
+                logging.warning(f"Skipping unknown card in cube {cube.name}: {card['name']}")
+                continue
+            card_ids.add(card_id)
+        cube_cards.extend(CubeCard(cube_id=cube.pk, card_id=card_id) for card_id in card_ids)
+
+        for name in set(data['archetypes']):
+            if name not in archetypes:
+                logging.warning(f"Skipping unknown archetype in cube {cube.name}: {name}")
+                continue
+            cube_archetypes.append(CubeArchetype(cube_id=cube.pk, archetype_id=archetypes[name]))
+
+    CubeCard.objects.bulk_create(cube_cards, batch_size=1000)
+    CubeArchetype.objects.bulk_create(cube_archetypes, batch_size=1000)
+    return len(cubes)
+
+
+def import_cubes(cubes, user, batch_size=CHUNK_SIZE):
+    """
+    Create cubes owned by user from an iterable of cube dicts, batch_size
+    cubes at a time. Returns the number of cubes created.
+    """
+    archetypes = dict(Archetype.objects.values_list('name', 'pk'))
+    created = 0
+    for batch in batched(cubes, batch_size):
+        with transaction.atomic():
+            created += import_batch(batch, user, archetypes)
+    return created
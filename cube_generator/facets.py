@@ -0,0 +1,239 @@
+"""
+In-memory facet index over the Card table.
+
+Every card is assigned a position, and each facet keeps a numpy array with
+the code of each card's value (a set name, a rarity, a color identity or a
+mana value bucket). Archetypes, of which a card can have several, are kept as
+parallel arrays of (position, archetype code) pairs. Filters become boolean
+masks over the positions, ANDed across facets, and a facet's counts are a
+single np.bincount over the codes of the matching cards. That is a few passes
+over the table per request instead of a GROUP BY per facet, and its cost does
+not grow with the number of distinct values. Unfiltered counts are computed
+once when the index is built.
+
+Each web process keeps its own copy of the index. Whatever changes the Card
+table or its archetype_weights calls facet_index_changed() when it is done;
+populate_cards does so at the end of ingest. That stores a new generation
+token in the shared cache, and get_facet_index() compares it on every call.
+When the token has moved on, the old index keeps being served while one
+background thread builds the new one. If the cache can't be reached, the
+error is logged and the current index is served unchanged.
+"""
+import logging
+import threading
+import time
+
+import numpy as np
+from django.core.cache import cache
+from django.db import connections
+
+from cube_generator.models import Card
+
+FACETS = ('set_name', 'rarity', 'color_identity', 'mana_value', 'archetype')
+
+# Facets where every card has exactly one value
+SINGLE_VALUE_FACETS = ('set_name', 'rarity', 'color_identity', 'mana_value')
+
+# Mana values of 7 or more are grouped together, matching how most cube
+# curves are displayed
+MANA_VALUE_MAX_BUCKET = 7
+
+# Archetype weights at or above this value count towards the archetype facet,
+# the same threshold used by Card.primary_archetypes
+ARCHETYPE_MIN_WEIGHT = 7
+
+GENERATION_CACHE_KEY = 'cube_generator:facet_index_generation'
+
+# Returned by current_generation() when the cache can't be read
+CACHE_UNAVAILABLE = object()
+
+_index = None
+_rebuilding = False
+_rebuild_thread = None
+_lock = threading.Lock()
+
+
+def mana_value_bucket(mana_value):
+    """Map a mana value to its facet bucket, e.g. 3.00 -> '3' and 9 -> '7+'."""
+    bucket = int(mana_value or 0)
+    if bucket >= MANA_VALUE_MAX_BUCKET:
+        return f'{MANA_VALUE_MAX_BUCKET}+'
+    return str(bucket)
+
+
+class FacetIndex:
+    """Facet value codes per card position, with the unfiltered counts precomputed."""
+
+    def __init__(self, generation=None):
+        self.generation = generation
+        self.size = 0
+        # Distinct values per facet, in the order their codes were assigned
+        self.values = {facet: [] for facet in FACETS}
+        self.codes = {facet: {} for facet in FACETS}
+        self.totals = {facet: {} for facet in FACETS}
+        # Filled by add_card() and turned into numpy arrays by finalize()
+        self.card_codes = {facet: [] for facet in SINGLE_VALUE_FACETS}
+        self.archetype_positions = []
+        self.archetype_codes = []
+
+    def code(self, facet, value):
+        codes = self.codes[facet]
+        if value not in codes:
+            codes[value] = len(codes)
+            self.values[facet].append(value)
+        return codes[value]
+
+    def add_card(self, set_name, rarity, color_identity, mana_value, archetype_weights):
+        position = self.size
+        self.size += 1
+
+        self.card_codes['set_name'].append(self.code('set_name', set_name))
+        self.card_codes['rarity'].append(self.code('rarity', rarity))
+        self.card_codes['color_identity'].append(self.code('color_identity', color_identity))
+        self.card_codes['mana_value'].append(self.code('mana_value', mana_value_bucket(mana_value)))
+        for archetype_id, weight in (archetype_weights or {}).items():
+            if weight >= ARCHETYPE_MIN_WEIGHT:
+                self.archetype_positions.append(position)
+                self.archetype_codes.append(self.code('archetype', str(archetype_id)))
+
+    def finalize(self):
+        """Convert the collected codes to numpy arrays and precompute the unfiltered counts."""
+        self.card_codes = {
+            facet: np.array(codes, dtype=np.int32)
+            for facet, codes in self.card_codes.items()
+        }
+        self.archetype_positions = np.array(self.archetype_positions, dtype=np.int32)
+        self.archetype_codes = np.array(self.archetype_codes, dtype=np.int32)
+        for facet in FACETS:
+            self.totals[facet] = self.count_values(facet, None)
+
+    def facet_codes(self, facet, mask):
+        """Codes of the values held by the cards in mask (all cards if mask is None)."""
+        if facet == 'archetype':
+            if mask is None:
+                return self.archetype_codes
+            return self.archetype_codes[mask[self.archetype_positions]]
+        if mask is None:
+            return self.card_codes[facet]
+        return self.card_codes[facet][mask]
+
+    def count_values(self, facet, mask):
+        counts = np.bincount(self.facet_codes(facet, mask), minlength=len(self.values[facet]))
+        return dict(zip(self.values[facet], counts.tolist()))
+
+    def filter_mask(self, facet, values):
+        """Boolean mask of the cards holding any of the given values of a facet."""
+        # Indexing a small per-value lookup table by the codes is much faster than np.isin
+        selected = np.zeros(len(self.values[facet]), dtype=bool)
+        selected[[self.codes[facet][str(value)] for value in values if str(value) in self.codes[facet]]] = True
+        if facet == 'archetype':
+            mask = np.zeros(self.size, dtype=bool)
+            mask[self.archetype_positions[selected[self.archetype_codes]]] = True
+            return mask
+        return selected[self.card_codes[facet]]
+
+    def match(self, masks, exclude=None):
+        """
+        AND together the filter masks of every facet except exclude, which is
+        what gives each facet its own counts. Returns None when nothing is
+        filtered, meaning all cards match.
+        """
+        result = None
+        for facet, mask in masks.items():
+            if facet == exclude:
+                continue
+            result = mask if result is None else result & mask
+        return result
+
+    def counts(self, filters=None):
+        """
+        Return {facet: {value: count}} for the given filters, plus the total
+        number of matching cards under 'total'.
+
+        filters maps a facet name to a list of selected values. Values within
+        a facet are ORed together and the facets are ANDed.
+        """
+        masks = {
+            facet: self.filter_mask(facet, values)
+            for facet, values in (filters or {}).items()
+            if facet in FACETS and values
+        }
+        matched = self.match(masks)
+        counts = {'total': self.size if matched is None else int(np.count_nonzero(matched))}
+        for facet in FACETS:
+            base = self.match(masks, exclude=facet)
+            counts[facet] = dict(self.totals[facet]) if base is None else self.count_values(facet, base)
+        return counts
+
+
+def build_facet_index(generation=None):
+    """Build a new FacetIndex by streaming the Card table once."""
+    index = FacetIndex(generation)
+    rows = Card.objects.values_list(
+        'set_name', 'rarity', 'color_identity', 'mana_value', 'archetype_weights'
+    ).order_by('pk')
+    for row in rows.iterator(chunk_size=2000):
+        index.add_card(*row)
+    index.finalize()
+    logging.info(f"Built facet index over {index.size} cards")
+    return index
+
+
+def facet_index_changed():
+    """
+    Tell every process that the Card table changed, so their facet indexes
+    are rebuilt. Call this after ingesting cards or rescoring archetype weights.
+    """
+    try:
+        cache.set(GENERATION_CACHE_KEY, time.time_ns(), timeout=None)
+    except Exception:
+        logging.exception("Could not store the facet index generation, web processes will keep their current index")
+
+
+def current_generation():
+    try:
+        return cache.get(GENERATION_CACHE_KEY)
+    except Exception:
+        logging.warning("Could not read the facet index generation", exc_info=True)
+        return CACHE_UNAVAILABLE
+
+
+def rebuild_in_background(generation):
+    global _index, _rebuilding
+    try:
+        index = build_facet_index(generation)
+        with _lock:
+            _index = index
+    except Exception:
+        logging.exception("Failed to rebuild facet index")
+    finally:
+        _rebuilding = False
+        # The thread has its own database connection, which nothing else will close
+        connections.close_all()
+
+
+def get_facet_index():
+    """
+    Return this process's facet index. It is built on first use; after that,
+    a stale index is returned as is while a rebuild runs in the background.
+    """
+    global _index, _rebuilding, _rebuild_thread
+    generation = current_generation()
+    index = _index
+
+    if index is None:
+        with _lock:
+            if _index is None:
+                _index = build_facet_index(None if generation is CACHE_UNAVAILABLE else generation)
+            return _index
+
+    if generation is CACHE_UNAVAILABLE:
+        return index
+
+    if index.generation != generation and not _rebuilding:
+        with _lock:
+            if _index.generation != generation and not _rebuilding:
+                _rebuilding = True
+                _rebuild_thread = threading.Thread(target=rebuild_in_background, args=(generation,), daemon=True)
+                _rebuild_thread.start()
+    return index
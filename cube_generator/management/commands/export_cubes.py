@@ -0,0 +1,35 @@
+import gzip
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cube_generator.cube_io import EXPORT_FORMATS, export_cubes
+from cube_generator.models import Cube
+
+
+class Command(BaseCommand):
+    help = "Stream cubes to a file or stdout as CSV, a plain list or JSON Lines"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='json')
+        parser.add_argument('--user', help="Only export cubes owned by this username")
+        parser.add_argument('--output', help="File to write to, gzipped if it ends in .gz (default: stdout)")
+
+    def handle(self, *args, **options):
+        cubes = Cube.objects.all()
+        if options['user']:
+            cubes = cubes.filter(user__username=options['user'])
+        chunks = export_cubes(cubes, options['format'])
+
+        output = options['output']
+        if output is None:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+
+        opener = gzip.open if output.endswith('.gz') else open
+        try:
+            with opener(output, 'wt', encoding='utf-8', newline='') as out:
+                for chunk in chunks:
+                    out.write(chunk)
+        except OSError as e:
+            raise CommandError(f"Could not write export: {e}")
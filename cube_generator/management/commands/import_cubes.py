@@ -0,0 +1,41 @@
+import csv
+import gzip
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from cube_generator.cube_io import DEFAULT_CUBE_NAME, EXPORT_FORMATS, import_cubes, read_cubes
+
+
+class Command(BaseCommand):
+    help = "Bulk import cubes from CSV, a plain list or JSON Lines, reading one cube at a time"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to read, gunzipped if it ends in .gz")
+        parser.add_argument('--user', required=True, help="Username that will own the imported cubes")
+        parser.add_argument('--format', choices=EXPORT_FORMATS, help="Defaults to the file extension")
+        parser.add_argument('--name', default=DEFAULT_CUBE_NAME, help="Name for cubes the file doesn't name, e.g. a CubeCobra export")
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or path.removesuffix('.gz').rsplit('.', 1)[-1]
+        if fmt not in EXPORT_FORMATS:
+            raise CommandError(f"Cannot tell the format of {path}, pass --format")
+
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['user']}")
+
+        opener = gzip.open if path.endswith('.gz') else open
+        try:
+            with opener(path, 'rt', encoding='utf-8', newline='') as lines:
+                cubes = read_cubes(lines, fmt, default_name=options['name'])
+                created = import_cubes(cubes, user, batch_size=options['batch_size'])
+        except (OSError, UnicodeDecodeError, json.JSONDecodeError, csv.Error, KeyError) as e:
+            # Batches imported before the error are kept
+            raise CommandError(f"Could not import {path}: {e!r}")
+
+        self.stdout.write(self.style.SUCCESS(f"Imported {created} cubes"))
@@ -59,6 +59,8 @@ class Card(models.Model):
         """Get the weight for a specific archetype"""
         return self.archetype_weights.get(str(archetype_id), 0)
     
+    # After rescoring cards, call cube_generator.facets.facet_index_changed()
+    # so the search facet counts pick up the new weights
     def set_archetype_weight(self, archetype_id, weight):
         """Set the weight for a specific archetype"""
         if weight > 0:  # Only store non-zero weights
@@ -1,3 +1,234 @@
-from django.test import TestCase
+import gzip
+import io
+import os
+import tempfile
+import time
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from cube_generator import facets
+from cube_generator.cube_io import export_cubes, import_cubes, read_cubes
+from cube_generator.facets import FacetIndex
+from cube_generator.models import Archetype, Card, Cube
+
+
+class FacetIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = FacetIndex()
+        self.index.add_card('Alpha', 'rare', 'U', 2, {'1': 8})
+        self.index.add_card('Alpha', 'common', 'U', 3, {'1': 5})
+        self.index.add_card('Alpha', 'rare', 'B', 7, {})
+        self.index.add_card('Beta', 'rare', 'U', 9, {'2': 10})
+        self.index.finalize()
+
+    def test_counts_without_filters(self):
+        counts = self.index.counts()
+        self.assertEqual(counts['total'], 4)
+        self.assertEqual(counts['set_name'], {'Alpha': 3, 'Beta': 1})
+        self.assertEqual(counts['mana_value'], {'2': 1, '3': 1, '7+': 2})
+        # Only weights of 7 or more count towards an archetype
+        self.assertEqual(counts['archetype'], {'1': 1, '2': 1})
+
+    def test_combined_filters(self):
+        counts = self.index.counts({'rarity': ['rare'], 'color_identity': ['U']})
+        self.assertEqual(counts['total'], 2)
+        self.assertEqual(counts['set_name'], {'Alpha': 1, 'Beta': 1})
+        self.assertEqual(counts['mana_value'], {'2': 1, '3': 0, '7+': 1})
+
+    def test_facet_ignores_its_own_filter(self):
+        counts = self.index.counts({'rarity': ['rare'], 'color_identity': ['U']})
+        # Rarity counts apply every filter except the rarity one
+        self.assertEqual(counts['rarity'], {'rare': 2, 'common': 1})
+        self.assertEqual(counts['color_identity'], {'U': 2, 'B': 1})
+
+    def test_values_within_a_facet_are_ored(self):
+        counts = self.index.counts({'mana_value': ['2', '7+']})
+        self.assertEqual(counts['total'], 3)
+
+    def test_archetype_filter(self):
+        counts = self.index.counts({'archetype': ['2']})
+        self.assertEqual(counts['total'], 1)
+        self.assertEqual(counts['set_name'], {'Alpha': 0, 'Beta': 1})
+
+    def test_counts_at_scryfall_size(self):
+        # Roughly the size of Scryfall's default_cards bulk data
+        index = FacetIndex()
+        rarities = ['common', 'uncommon', 'rare', 'mythic']
+        colors = ['W', 'U', 'B', 'R', 'G', 'C', 'BG', 'GRU']
+        for n in range(110000):
+            index.add_card(f'Set {n % 900}', rarities[n % 4], colors[n % 8], n % 11, {str(n % 30): 8})
+        index.finalize()
+
+        for filters in ({}, {'rarity': ['rare'], 'color_identity': ['U']}, {'set_name': ['Set 3'], 'archetype': ['5']}):
+            timings = []
+            for _ in range(5):
+                start = time.perf_counter()
+                index.counts(filters)
+                timings.append(time.perf_counter() - start)
+            self.assertLess(min(timings), 0.01, filters)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class FacetIndexRebuildTests(TransactionTestCase):
+    def create_card(self, n):
+        Card.objects.create(
+            scryfall_id=f'id-{n}', name=f'Card {n}', mana_value=n, type_line='Creature',
+            color_identity='G', set_name='Alpha', rarity='common', edhrec_rank=n,
+            img_url='https://example.com/card.jpg',
+        )
+
+    def setUp(self):
+        self.reset_facet_index()
+        self.addCleanup(self.reset_facet_index)
+
+    def reset_facet_index(self):
+        facets._index = None
+        facets._rebuilding = False
+        facets._rebuild_thread = None
+
+    def test_rebuilds_in_background_after_change(self):
+        self.create_card(1)
+        self.assertEqual(facets.get_facet_index().size, 1)
+
+        self.create_card(2)
+        self.assertEqual(facets.get_facet_index().size, 1)
+
+        facets.facet_index_changed()
+        # The old index is served while the new one is built
+        self.assertEqual(facets.get_facet_index().size, 1)
+        facets._rebuild_thread.join(timeout=10)
+        self.assertEqual(facets.get_facet_index().size, 2)
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'missing_cache_table',
+    }})
+    def test_missing_cache_table(self):
+        self.create_card(1)
+        with self.assertLogs(level='WARNING'):
+            facets.facet_index_changed()
+            self.assertEqual(facets.get_facet_index().size, 1)
+            self.assertEqual(facets.get_facet_index().size, 1)
+
+
+class CubeExportImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('exporter', password='password')
+        self.importer = User.objects.create_user('importer')
+        self.archetype = Archetype.objects.create(name='Ramp', description='')
+        self.cards = [
+            Card.objects.create(
+                scryfall_id=f'id-{n}', name=f'Card {n}', mana_value=n, type_line='Creature',
+                color_identity='G', set_name='Alpha', rarity='common', edhrec_rank=n,
+                img_url='https://example.com/card.jpg',
+            )
+            for n in range(3)
+        ]
+        # Two cubes with the same name next to each other, then an empty cube
+        first = Cube.objects.create(name='Same', description='First', user=self.user)
+        first.cards.set(self.cards[:2])
+        first.archetypes.add(self.archetype)
+        second = Cube.objects.create(name='Same', description='Second', user=self.user)
+        second.cards.set(self.cards[2:])
+        Cube.objects.create(name='Empty', description='', user=self.user)
+
+    def round_trip(self, fmt):
+        text = ''.join(export_cubes(Cube.objects.filter(user=self.user), fmt))
+        created = import_cubes(read_cubes(io.StringIO(text, newline=''), fmt), self.importer)
+        self.assertEqual(created, 3)
+        return list(Cube.objects.filter(user=self.importer).order_by('pk'))
+
+    def assertCardsRoundTrip(self, cubes):
+        self.assertEqual([cube.name for cube in cubes], ['Same', 'Same', 'Empty'])
+        self.assertEqual(
+            [sorted(card.name for card in cube.cards.all()) for cube in cubes],
+            [['Card 0', 'Card 1'], ['Card 2'], []],
+        )
+
+    def test_json_round_trip(self):
+        cubes = self.round_trip('json')
+        self.assertCardsRoundTrip(cubes)
+        self.assertEqual(cubes[0].description, 'First')
+        self.assertEqual(list(cubes[0].archetypes.all()), [self.archetype])
+
+    def test_csv_round_trip(self):
+        self.assertCardsRoundTrip(self.round_trip('csv'))
+
+    def test_txt_round_trip(self):
+        self.assertCardsRoundTrip(self.round_trip('txt'))
+
+    def test_single_cube_txt_has_no_header(self):
+        cube = Cube.objects.filter(user=self.user).first()
+        text = ''.join(export_cubes(Cube.objects.filter(pk=cube.pk), 'txt', single_cube=True))
+        self.assertEqual(text, 'Card 0\nCard 1\n')
+
+    def test_unknown_scryfall_id_falls_back_to_name(self):
+        lines = ['{"name": "Other", "cards": [{"scryfall_id": "elsewhere", "name": "Card 1"}]}\n']
+        import_cubes(read_cubes(lines, 'json'), self.importer)
+        cube = Cube.objects.get(user=self.importer)
+        self.assertEqual(list(cube.cards.all()), [self.cards[1]])
+
+    def test_cubecobra_csv_import(self):
+        lines = [
+            'name,CMC,Type,Color,Set,Collector Number,Rarity,Color Category,status,Finish,maybeboard,image URL,image Back URL,tags,Notes,MTGO ID\n',
+            'Card 0,0,Creature,G,alp,1,common,g,Owned,Non-foil,false,,,,,\n',
+            'Card 2,2,Creature,G,alp,2,common,g,Owned,Non-foil,false,,,,,\n',
+        ]
+        import_cubes(read_cubes(lines, 'csv', default_name='From CubeCobra'), self.importer)
+        cube = Cube.objects.get(user=self.importer)
+        self.assertEqual(cube.name, 'From CubeCobra')
+        self.assertEqual(sorted(card.name for card in cube.cards.all()), ['Card 0', 'Card 2'])
+
+    def test_export_streams_gzip(self):
+        self.client.force_login(self.user)
+        response = self.client.get('/cubes/export.json', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        text = gzip.decompress(b''.join(response.streaming_content)).decode()
+        self.assertEqual(text, ''.join(export_cubes(Cube.objects.filter(user=self.user), 'json')))
+
+    def test_export_without_gzip(self):
+        self.client.force_login(self.user)
+        response = self.client.get('/cubes/export.txt')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'# Same\n'))
+
+    def test_export_requires_login(self):
+        response = self.client.get('/cubes/export.json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_export_command_writes_to_stdout(self):
+        out = io.StringIO()
+        call_command('export_cubes', format='txt', user='exporter', stdout=out)
+        self.assertEqual(out.getvalue(), '# Same\nCard 0\nCard 1\n\n# Same\nCard 2\n\n# Empty\n\n')
+
+    def test_export_command_bad_output_path(self):
+        with self.assertRaises(CommandError):
+            call_command('export_cubes', output='/nonexistent/cubes.json')
+
+    def write_file(self, suffix, text):
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_import_command(self):
+        path = self.write_file('.txt', 'Card 0\nCard 1\n')
+        out = io.StringIO()
+        call_command('import_cubes', path, user='importer', name='Listed', stdout=out)
+        self.assertIn('Imported 1 cubes', out.getvalue())
+        cube = Cube.objects.get(user=self.importer)
+        self.assertEqual(cube.name, 'Listed')
+        self.assertEqual(cube.cards.count(), 2)
+
+    def test_import_command_missing_file(self):
+        with self.assertRaises(CommandError):
+            call_command('import_cubes', '/nonexistent/cubes.json', user='importer')
+
+    def test_import_command_malformed_json(self):
+        path = self.write_file('.json', '{"name": \n')
+        with self.assertRaises(CommandError):
+            call_command('import_cubes', path, user='importer')
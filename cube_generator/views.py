@@ -1,11 +1,50 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.views.generic import ListView
-from cube_generator.models import Card
+from cube_generator.models import Card, Cube
 from django.contrib.auth.models import User
-from django.http import HttpResponseRedirect
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.views.decorators.gzip import gzip_page
+from cube_generator.cube_io import EXPORT_FORMATS, export_cubes
+from cube_generator.facets import FACETS, get_facet_index
 
 # Create your views here.
 
 
 class GetCard(ListView):
     model = Card
+
+
+def facet_counts(request):
+    """Return facet counts for the filters in the query string, e.g. ?rarity=rare&color_identity=U"""
+    filters = {facet: request.GET.getlist(facet) for facet in FACETS if facet in request.GET}
+    return JsonResponse(get_facet_index().counts(filters))
+
+
+def stream_cubes(request, queryset, fmt, filename, single_cube=False):
+    """Stream the cubes in queryset as a download."""
+    if fmt not in EXPORT_FORMATS:
+        raise Http404(f"Unknown export format: {fmt}")
+    response = StreamingHttpResponse(
+        export_cubes(queryset, fmt, single_cube=single_cube),
+        content_type=f"{EXPORT_FORMATS[fmt]}; charset=utf-8",
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    return response
+
+
+# There is no login page yet, so anonymous requests get a 403 rather than a
+# redirect to a login URL that doesn't exist
+@gzip_page
+def export_cube(request, cube_id, fmt):
+    if not request.user.is_authenticated:
+        raise PermissionDenied
+    cube = get_object_or_404(Cube, pk=cube_id, user=request.user)
+    return stream_cubes(request, Cube.objects.filter(pk=cube.pk), fmt, f"cube-{cube.pk}", single_cube=True)
+
+
+@gzip_page
+def export_user_cubes(request, fmt):
+    if not request.user.is_authenticated:
+        raise PermissionDenied
+    return stream_cubes(request, Cube.objects.filter(user=request.user), fmt, f"{request.user.username}-cubes")
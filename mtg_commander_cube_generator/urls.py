@@ -17,9 +17,12 @@ Including another URLconf
 
 from django.contrib import admin
 from django.urls import path, include
-from cube_generator.views import GetCard
+from cube_generator.views import GetCard, facet_counts, export_cube, export_user_cubes
 
 urlpatterns = [
     path("admin/", admin.site.urls),
-    path("test/", GetCard.as_view(), name='base')
+    path("test/", GetCard.as_view(), name='base'),
+    path("cards/facets/", facet_counts, name='card_facets'),
+    path("cubes/export.<str:fmt>", export_user_cubes, name='export_user_cubes'),
+    path("cubes/<int:cube_id>/export.<str:fmt>", export_cube, name='export_cube')
 ]
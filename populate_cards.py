@@ -7,6 +7,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mtg_commander_cube_generator.se
 django.setup()
 
 from cube_generator.models import Card
+from cube_generator.facets import facet_index_changed
 
 logging.basicConfig(level=logging.DEBUG)
 
@@ -109,7 +110,10 @@ def populate_cards():
                 logging.error(f"Exception: {e}")
                 raise  # Re-raise the exception to halt execution
 
-    # Step 6: Print a success message after populating the database
+    # Step 6: Have the web processes rebuild the facet counts used by the search filters
+    facet_index_changed()
+
+    # Step 7: Print a success message after populating the database
     print('Successfully populated the database with Scryfall data')
 
 if __name__ == '__main__':